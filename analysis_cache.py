@@ -0,0 +1,102 @@
+"""Exact-match cache of Grok analyses keyed by text hash."""
+from collections import OrderedDict
+from typing import Dict, Iterable, List
+import hashlib
+import os
+from sqlalchemy import select, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import AnalysisCache
+from database import engine
+
+
+class ExactMatchCache:
+    """In-process LRU in front of the `analysis_cache` table."""
+
+    def __init__(self, max_entries: int = 10_000):
+        """
+        Args:
+            max_entries: Maximum analyses kept in the in-process LRU
+        """
+        self.max_entries = max_entries
+        self._lru: "OrderedDict[str, Dict]" = OrderedDict()
+        self._unsaved: Dict[str, Dict] = {}
+
+    @staticmethod
+    def key(text: str) -> str:
+        """Hash text into its cache key."""
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _remember(self, text_hash: str, analysis: Dict):
+        """Insert into the LRU, evicting the least recently used entry."""
+        self._lru[text_hash] = analysis
+        self._lru.move_to_end(text_hash)
+        if len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    async def get_many(self, db: AsyncSession, texts: Iterable[str]) -> Dict[str, Dict]:
+        """Return cached analyses for the given texts, keyed by text."""
+        found = {}
+        missing = {}
+        for text in texts:
+            text_hash = self.key(text)
+            if text_hash in self._lru:
+                self._lru.move_to_end(text_hash)
+                found[text] = self._lru[text_hash]
+            else:
+                missing[text_hash] = text
+
+        if missing:
+            # One indexed lookup for everything the LRU didn't have
+            result = await db.execute(
+                select(AnalysisCache.text_hash, AnalysisCache.analysis)
+                .where(AnalysisCache.text_hash.in_(missing))
+            )
+            for text_hash, analysis in result:
+                self._remember(text_hash, analysis)
+                found[missing[text_hash]] = analysis
+
+        return found
+
+    def add(self, text: str, analysis: Dict):
+        """Cache a new analysis; it is written to the DB on the next flush."""
+        text_hash = self.key(text)
+        self._remember(text_hash, analysis)
+        self._unsaved[text_hash] = analysis
+
+    async def flush(self, db: AsyncSession) -> List[str]:
+        """
+        Write unsaved analyses within the caller's transaction.
+
+        Returns the keys written; pass them to `mark_saved` once the transaction
+        commits. Until then they stay unsaved and are written again on the next flush.
+        """
+        if not self._unsaved:
+            return []
+
+        rows = [
+            {"text_hash": text_hash, "analysis": analysis}
+            for text_hash, analysis in self._unsaved.items()
+        ]
+
+        # Another worker may have cached the same text concurrently
+        if engine.dialect.name == "postgresql":
+            stmt = postgresql.insert(AnalysisCache).on_conflict_do_nothing()
+        elif engine.dialect.name == "sqlite":
+            stmt = sqlite.insert(AnalysisCache).on_conflict_do_nothing()
+        else:
+            stmt = insert(AnalysisCache)
+
+        await db.execute(stmt, rows)
+        return [row["text_hash"] for row in rows]
+
+    def mark_saved(self, keys: Iterable[str]):
+        """Forget unsaved analyses whose flush has been committed."""
+        for text_hash in keys:
+            self._unsaved.pop(text_hash, None)
+
+
+# Global exact-match cache instance
+exact_cache = ExactMatchCache(
+    max_entries=int(os.getenv("ANALYSIS_CACHE_SIZE", "10000")),
+)
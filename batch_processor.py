@@ -1,22 +1,76 @@
 """Background batch processor for analyzing conversations."""
 import asyncio
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, insert, update, func, or_, Row
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from models import Conversation, Insight
-from grok_client import analyze_conversation
-from datetime import datetime
+from grok_client import analyze_conversation, normalize_analysis
+from semantic_cache import semantic_cache, Vector
+from analysis_cache import exact_cache
+from metrics import metrics
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from collections import defaultdict
 import logging
-from database import AsyncSessionLocal
+import random
+import time
+from database import AsyncSessionLocal, engine, NOTIFY_CHANNEL
 
 logger = logging.getLogger(__name__)
 
+# Errors worth retrying: the database or network is temporarily unavailable
+RETRYABLE_ERRORS = (
+    OperationalError,
+    InterfaceError,
+    PoolTimeoutError,
+    ConnectionError,
+    TimeoutError,
+)
+MAX_BACKOFF = 30.0
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Whether an error in the processing loop is transient."""
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
 class BatchProcessor:
     """Processes conversations in batches using Grok API."""
     
-    def __init__(self, batch_size: int = 10):
+    def __init__(
+        self,
+        batch_size: int = 10,
+        reconcile_interval: float = 60.0,
+        task_timeout: float = 60.0,
+        min_batch_size: int = 1,
+        max_batch_size: int = 50,
+        claim_timeout: float = 300.0,
+    ):
         self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.reconcile_interval = reconcile_interval
+        self.task_timeout = task_timeout
+        self.claim_timeout = claim_timeout
         self.running = False
         self.task = None
+        self.listen_task = None
+        # True while the Postgres LISTEN connection is relaying insert notifications
+        self.listening = False
+        self._wakeup = asyncio.Event()
+        
+        # Best-effort count of pending rows, resynced from the DB periodically
+        self._pending_hint: int = 0
+        self._last_reconcile: Optional[float] = None
+        
+        # Seconds to wait after the next transient error (doubles each time)
+        self._backoff = 1.0
+        
+        # Conversations this worker has claimed but not yet finished
+        self._claimed_ids: List[str] = []
     
     async def start(self):
         """Start the batch processor."""
@@ -25,90 +79,351 @@ class BatchProcessor:
         
         self.running = True
         self.task = asyncio.create_task(self._process_loop())
+        if engine.dialect.name == "postgresql":
+            self.listen_task = asyncio.create_task(self._listen_loop())
         logger.info("Batch processor started")
     
     async def stop(self):
         """Stop the batch processor."""
         self.running = False
-        if self.task:
-            self.task.cancel()
+        for task in (self.task, self.listen_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        # Hand an interrupted batch back to the queue
+        await self._reset_claimed("pending")
+        logger.info("Batch processor stopped")
+    
+    @property
+    def alive(self) -> bool:
+        """Whether the processing loop is running."""
+        return self.running and self.task is not None and not self.task.done()
+    
+    def notify(self):
+        """Wake the processing loop because new work was queued."""
+        self._pending_hint += 1
+        self._wakeup.set()
+    
+    def _seconds_until_reconcile(self) -> float:
+        """Seconds left before the pending hint must be resynced from the DB."""
+        if self._last_reconcile is None:
+            return 0.0
+        elapsed = time.monotonic() - self._last_reconcile
+        return max(0.0, self.reconcile_interval - elapsed)
+    
+    async def _reconcile(self, db: AsyncSession):
+        """Requeue expired claims and resync the pending hint with the DB."""
+        # Claims older than the timeout belong to a worker that died mid-batch
+        cutoff = datetime.utcnow() - timedelta(seconds=self.claim_timeout)
+        released = await db.execute(
+            update(Conversation)
+            .where(
+                Conversation.status == "processing",
+                or_(Conversation.claimed_at.is_(None), Conversation.claimed_at < cutoff),
+            )
+            .values(status="pending", claimed_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        if released.rowcount:
+            logger.warning(f"Requeued {released.rowcount} conversations with expired claims")
+        
+        result = await db.execute(
+            select(func.count())
+            .select_from(Conversation)
+            .where(Conversation.status == "pending")
+        )
+        self._pending_hint = result.scalar_one()
+        self._last_reconcile = time.monotonic()
+        metrics.pending_depth = self._pending_hint
+    
+    async def _wait_for_work(self, timeout: float = 30):
+        """Sleep until notified of new work, or until the safety timeout."""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._wakeup.clear()
+    
+    async def _listen_loop(self):
+        """Relay Postgres NOTIFY events from the conversations insert trigger."""
+        while self.running:
             try:
-                await self.task
+                async with engine.connect() as conn:
+                    raw_conn = await conn.get_raw_connection()
+                    pg_conn = raw_conn.driver_connection
+                    lost = asyncio.get_running_loop().create_future()
+                    
+                    def on_terminate(_conn):
+                        # Fall back to in-process wakeups until reconnected
+                        self.listening = False
+                        if not lost.done():
+                            lost.set_result(None)
+                    
+                    callback = lambda *args: self.notify()
+                    pg_conn.add_termination_listener(on_terminate)
+                    await pg_conn.add_listener(NOTIFY_CHANNEL, callback)
+                    self.listening = True
+                    # NOTIFYs sent while not listening were missed; resync the pending count
+                    self._last_reconcile = None
+                    self._wakeup.set()
+                    try:
+                        # Hold the connection open until it drops; NOTIFYs arrive via the callback
+                        await lost
+                    finally:
+                        self.listening = False
+                        pg_conn.remove_termination_listener(on_terminate)
+                        if not pg_conn.is_closed():
+                            await pg_conn.remove_listener(NOTIFY_CHANNEL, callback)
+                logger.warning("Notification listener connection lost, reconnecting")
             except asyncio.CancelledError:
-                pass
-        logger.info("Batch processor stopped")
+                raise
+            except Exception as e:
+                logger.error(f"Error in notification listener: {e}")
+                await asyncio.sleep(5)
     
     async def _process_loop(self):
         """Main processing loop."""
         while self.running:
             try:
+                reconcile_in = self._seconds_until_reconcile()
+                if self._pending_hint <= 0 and reconcile_in > 0:
+                    # Queue is known to be empty, skip the pending SELECT
+                    await self._wait_for_work(timeout=min(30, reconcile_in))
+                    continue
+                
                 # Create a new session for each batch
                 async with AsyncSessionLocal() as db:
-                    # Get pending conversations
-                    result = await db.execute(
-                        select(Conversation)
-                        .where(Conversation.status == "pending")
-                        .limit(self.batch_size)
-                    )
-                    conversations = result.scalars().all()
+                    if reconcile_in <= 0:
+                        async with db.begin():
+                            await self._reconcile(db)
+                        if self._pending_hint <= 0:
+                            continue
+                    
+                    # Commit the claim on its own so no lock is held across the Grok calls
+                    async with db.begin():
+                        conversations = await self._claim_batch(db)
+                    self._claimed_ids = [conv.id for conv in conversations]
                     
                     if not conversations:
-                        # No pending conversations, wait a bit
-                        await asyncio.sleep(5)
+                        # Hint was stale; idle until the next insert or reconcile
+                        self._pending_hint = 0
                         continue
                     
                     # Process batch
                     await self._process_batch(db, conversations)
+                    self._claimed_ids = []
+                    
+                    if len(conversations) == self.batch_size:
+                        # A full batch suggests more rows are waiting
+                        self._pending_hint = max(self._pending_hint, 1)
+                    
+                    self._adapt_batch_size()
+                
+                self._backoff = 1.0
                 
                 # Small delay between batches to respect rate limits
                 await asyncio.sleep(1)
                 
             except Exception as e:
-                logger.error(f"Error in batch processor: {e}")
-                await asyncio.sleep(5)
+                if _is_retryable(e):
+                    # Don't leave the batch stuck in processing; it is retried
+                    logger.error(f"Transient error in batch processor, retrying in {self._backoff:.0f}s: {e}")
+                    await self._reset_claimed("pending")
+                else:
+                    # Retrying would likely hit the same error, so fail this batch and move on
+                    logger.error(
+                        f"Unexpected error in batch processor, failing current batch: {e}",
+                        exc_info=True,
+                    )
+                    metrics.conversations_processed["failed"] += len(self._claimed_ids)
+                    await self._reset_claimed("failed")
+                
+                # Exponential backoff with jitter
+                await asyncio.sleep(self._backoff + random.random())
+                self._backoff = min(self._backoff * 2, MAX_BACKOFF)
+    
+    async def _reset_claimed(self, status: str):
+        """Move this worker's unfinished claimed conversations to `status`."""
+        if not self._claimed_ids:
+            return
+        
+        ids, self._claimed_ids = self._claimed_ids, []
+        try:
+            async with AsyncSessionLocal() as db:
+                async with db.begin():
+                    await db.execute(
+                        update(Conversation)
+                        .where(Conversation.id.in_(ids), Conversation.status == "processing")
+                        .values(status=status, claimed_at=None)
+                        .execution_options(synchronize_session=False)
+                    )
+            logger.info(f"Marked {len(ids)} claimed conversations as {status}")
+        except Exception as e:
+            # The claims expire and are requeued by a later reconcile
+            logger.error(f"Error resetting claimed conversations: {e}")
+    
+    def _adapt_batch_size(self):
+        """Shrink the batch while Grok rate limits us; grow it while work backs up."""
+        if metrics.grok_429_rate() > 0.05:
+            self.batch_size = max(self.min_batch_size, self.batch_size - 1)
+        elif (
+            self._pending_hint > 2 * self.batch_size
+            and metrics.grok_latency_ms(0.5) < 2000
+        ):
+            self.batch_size = min(self.max_batch_size, self.batch_size + 2)
+        
+        metrics.batch_size = self.batch_size
+        metrics.pending_depth = self._pending_hint
+    
+    async def _claim_batch(self, db: AsyncSession) -> list:
+        """
+        Atomically mark up to batch_size pending conversations as processing.
+        
+        Returns (id, text, timestamp) rows for the claimed conversations.
+        """
+        pending_ids = (
+            select(Conversation.id)
+            .where(Conversation.status == "pending")
+            .order_by(Conversation.created_at, Conversation.id)
+            .limit(self.batch_size)
+        )
+        if engine.dialect.name == "postgresql":
+            # Let concurrent workers claim disjoint rows without blocking
+            pending_ids = pending_ids.with_for_update(skip_locked=True)
+        
+        # Single UPDATE ... RETURNING: SQLite holds the write lock for the
+        # whole statement, so no other worker can claim the same rows.
+        # Only the columns needed for analysis are returned (skips raw_data)
+        result = await db.execute(
+            update(Conversation)
+            .where(Conversation.id.in_(pending_ids.scalar_subquery()))
+            .values(status="processing", claimed_at=datetime.utcnow())
+            .returning(Conversation.id, Conversation.text, Conversation.timestamp),
+            execution_options={"synchronize_session": False},
+        )
+        return result.all()
     
     async def _process_batch(self, db: AsyncSession, conversations: list):
         """Process a batch of conversations."""
-        tasks = []
+        # Exact-match cache lookup for the whole batch in one query
+        async with db.begin():
+            cached = await exact_cache.get_many(db, {conv.text for conv in conversations})
+        
+        # Identical texts are analyzed once and fanned out to every conversation
+        groups: Dict[str, list] = defaultdict(list)
         for conv in conversations:
-            # Update status to processing
-            conv.status = "processing"
-            tasks.append(self._process_single(db, conv))
+            groups[conv.text].append(conv)
+        
+        # Embed every uncached text in one pass and look for near-duplicates;
+        # the similarity scan is CPU-bound, so keep it off the event loop
+        uncached = [text for text in groups if text not in cached]
+        vectors, similar = {}, {}
+        if uncached:
+            vectors, similar = await asyncio.to_thread(semantic_cache.lookup_many, uncached)
+        cached.update(similar)
+        
+        # Process in parallel (respecting Grok rate limits). _process_group
+        # handles its own errors, so one failure never cancels its siblings
+        tasks = []
+        try:
+            async with asyncio.TaskGroup() as tg:
+                for text, group in groups.items():
+                    tasks.append(tg.create_task(
+                        self._process_group(group, cached.get(text), vectors.get(text))
+                    ))
+        except* Exception as eg:
+            logger.error(f"Unexpected error in batch: {eg.exceptions}")
+        
+        insights = []
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception() is None:
+                insights.extend(task.result())
         
-        # Process in parallel (respecting Grok rate limits)
-        await asyncio.gather(*tasks, return_exceptions=True)
-        await db.commit()
+        completed_ids = [r["conversation_id"] for r in insights]
+        completed = set(completed_ids)
+        failed_ids = [conv.id for conv in conversations if conv.id not in completed]
+        
+        # Write the whole batch in one transaction: one INSERT and one UPDATE per status
+        async with db.begin():
+            if insights:
+                await db.execute(insert(Insight), insights)
+            for status, ids in (("completed", completed_ids), ("failed", failed_ids)):
+                if ids:
+                    await db.execute(
+                        update(Conversation)
+                        .where(Conversation.id.in_(ids))
+                        .values(status=status)
+                        .execution_options(synchronize_session=False)
+                    )
+            flushed = await exact_cache.flush(db)
+        exact_cache.mark_saved(flushed)
+        metrics.conversations_processed["completed"] += len(completed_ids)
+        metrics.conversations_processed["failed"] += len(failed_ids)
+        self._pending_hint = max(0, self._pending_hint - len(conversations))
     
-    async def _process_single(self, db: AsyncSession, conversation: Conversation):
-        """Process a single conversation."""
+    async def _process_group(
+        self,
+        conversations: List[Row],
+        analysis: Optional[Dict] = None,
+        vector: Optional[Vector] = None,
+    ) -> List[Dict]:
+        """
+        Analyze conversations sharing the same text, reusing a cached analysis if given.
+        
+        Returns the Insight row values for each conversation, or [] if the analysis failed.
+        """
+        text = conversations[0].text
+        ids = ", ".join(conv.id for conv in conversations)
         try:
-            # Analyze with Grok
-            analysis = await analyze_conversation(conversation.text)
+            if analysis is None:
+                # Analyze with Grok; bound the wait so a hung call can't stall the batch
+                async with asyncio.timeout(self.task_timeout):
+                    analysis = await analyze_conversation(text)
+                if analysis["confidence"] > 0:
+                    # Skip caching fallback results from unparseable responses
+                    exact_cache.add(text, analysis)
+                    semantic_cache.add(text, analysis, vector)
+            else:
+                # Cached analyses may predate normalization of Grok responses
+                analysis = normalize_analysis(analysis)
             
-            # Create insight record
-            insight = Insight(
-                conversation_id=conversation.id,
-                timestamp=conversation.timestamp,
-                text=conversation.text,
-                sentiment_score=analysis["sentiment_score"],
-                clusters=analysis["clusters"],
-                confidence=analysis["confidence"],
-                reasoning=analysis["reasoning"],
-                grok_analysis=analysis,
-            )
+            logger.info(f"Processed conversation {ids}")
             
-            db.add(insight)
+            return [
+                {
+                    "conversation_id": conv.id,
+                    "timestamp": conv.timestamp,
+                    "text": text,
+                    "sentiment_score": analysis["sentiment_score"],
+                    "clusters": analysis["clusters"],
+                    "confidence": analysis["confidence"],
+                    "reasoning": analysis["reasoning"],
+                    "grok_analysis": analysis,
+                }
+                for conv in conversations
+            ]
             
-            # Update conversation status
-            conversation.status = "completed"
-            
-            logger.info(f"Processed conversation {conversation.id}")
+        except TimeoutError:
+            logger.error(f"Timed out processing conversation {ids}")
+            return []
             
         except Exception as e:
-            logger.error(f"Error processing conversation {conversation.id}: {e}")
-            conversation.status = "failed"
+            logger.error(f"Error processing conversation {ids}: {e}")
+            return []
 
 
 # Global batch processor instance
 batch_processor = BatchProcessor(batch_size=10)
 
+
+def notify_new_conversation():
+    """Signal the global batch processor that a conversation was queued."""
+    if batch_processor.listening:
+        # The insert trigger's NOTIFY already signals it; don't count it twice
+        return
+    batch_processor.notify()
+
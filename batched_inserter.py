@@ -0,0 +1,170 @@
+"""Micro-batching of conversation inserts from the submit endpoint."""
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import insert
+from models import Conversation
+from database import AsyncSessionLocal
+from schemas import to_naive_utc
+import logging
+
+logger = logging.getLogger(__name__)
+
+Pending = Tuple[Dict, asyncio.Future]
+
+
+class BatchedInserter:
+    """
+    Coalesces concurrent conversation submissions into multi-row INSERTs.
+
+    Callers submit one row and await its id; a single worker collects whatever
+    arrives within `max_wait` seconds (up to `max_batch` rows) and writes it in
+    one transaction. Rows are validated before they are queued, and a batch the
+    database rejects is retried row by row, so one bad row fails only its own
+    caller.
+    """
+
+    def __init__(self, max_batch: int = 50, max_wait: float = 0.01):
+        """
+        Args:
+            max_batch: Maximum rows written per INSERT
+            max_wait: Seconds to wait for more rows after the first one arrives
+        """
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.running = False
+        self.task = None
+        self._queue: "asyncio.Queue[Optional[Pending]]" = asyncio.Queue()
+
+    async def start(self):
+        """Start the insert worker."""
+        if self.running:
+            return
+
+        self.running = True
+        # Fresh queue: a restarted app may run on a new event loop
+        self._queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+        logger.info("Batched inserter started")
+
+    async def stop(self):
+        """Stop accepting rows and wait for queued ones to be written."""
+        if not self.running:
+            return
+
+        self.running = False
+        # Sentinel: everything queued before it is still inserted
+        self._queue.put_nowait(None)
+        await self.task
+        logger.info("Batched inserter stopped")
+
+    async def submit(self, values: Dict) -> str:
+        """
+        Queue one conversation row and return its id once written.
+
+        Raises ValueError if the row is invalid, or the database error if the
+        row itself is rejected.
+        """
+        if not self.running:
+            raise RuntimeError("Batched inserter is not running")
+
+        values = self._prepare(values)
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((values, future))
+        return await future
+
+    @staticmethod
+    def _prepare(values: Dict) -> Dict:
+        """Validate a row against the conversations table and store datetimes as naive UTC."""
+        columns = Conversation.__table__.columns
+        unknown = set(values) - set(columns.keys())
+        if unknown:
+            raise ValueError(f"Unknown conversation fields: {', '.join(sorted(unknown))}")
+        for column in columns:
+            if column.nullable or values.get(column.key) is not None:
+                continue
+            if column.key in values or column.default is None:
+                raise ValueError(f"Missing required field: {column.key}")
+
+        return {
+            key: to_naive_utc(value) if isinstance(value, datetime) else value
+            for key, value in values.items()
+        }
+
+    async def _collect(self) -> Tuple[List[Pending], bool]:
+        """Wait for the next batch; the flag is set once the sentinel is seen."""
+        item = await self._queue.get()
+        if item is None:
+            return [], True
+
+        batch = [item]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except TimeoutError:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+
+        return batch, False
+
+    async def _run(self):
+        """Insert batches until stopped."""
+        while True:
+            batch, stopping = await self._collect()
+            if batch:
+                await self._write(batch)
+            if stopping:
+                return
+
+    async def _write(self, batch: List[Pending]):
+        """Write a batch, falling back to one row at a time if it is rejected."""
+        try:
+            await self._insert_batch(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error(f"Error inserting conversation: {e}")
+                self._fail(batch, e)
+                return
+            # Isolate the failing rows so the rest of the batch still succeeds
+            logger.warning(f"Batch of {len(batch)} conversations rejected, retrying row by row: {e}")
+            for item in batch:
+                try:
+                    await self._insert_batch([item])
+                except Exception as row_error:
+                    logger.error(f"Error inserting conversation: {row_error}")
+                    self._fail([item], row_error)
+
+    async def _insert_batch(self, batch: List[Pending]):
+        """Write one batch and resolve each caller's future with its id."""
+        async with AsyncSessionLocal() as db:
+            async with db.begin():
+                result = await db.execute(
+                    insert(Conversation).returning(
+                        Conversation.id, sort_by_parameter_order=True
+                    ),
+                    [values for values, _ in batch],
+                )
+                ids = result.scalars().all()
+
+        for (_, future), conv_id in zip(batch, ids):
+            if not future.done():
+                future.set_result(conv_id)
+
+    @staticmethod
+    def _fail(batch: List[Pending], error: Exception):
+        """Pass an insert error to the callers of the given rows."""
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+
+# Global inserter instance
+conversation_inserter = BatchedInserter(max_batch=50, max_wait=0.01)
+
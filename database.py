@@ -1,18 +1,66 @@
 """Database connection and session management."""
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.orm import declarative_base
+from sqlalchemy import event, inspect, text
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from models import Base
 import os
 
-# Use SQLite for simplicity and resource efficiency
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./insights.db")
+ENV = os.getenv("ENV", "dev")
+
+# SQLite for local development (simple, resource efficient); Postgres elsewhere,
+# since SQLite is single-writer and can't be shared by multiple processors
+DATABASE_URL = os.getenv("DATABASE_URL") or (
+    "sqlite+aiosqlite:///./insights.db"
+    if ENV == "dev"
+    else "postgresql+asyncpg://postgres@localhost:5432/insights"
+)
+
+# Set RUN_DDL=0 when a migration tool owns the schema
+RUN_DDL = os.getenv("RUN_DDL", "1") != "0"
+
+if DATABASE_URL.startswith("sqlite"):
+    # SQLite is single-writer: keep a few reusable connections instead of
+    # SQLAlchemy's default NullPool, which opens a new connection per session
+    engine_options = {
+        "poolclass": AsyncAdaptedQueuePool,
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "5")),
+        "connect_args": {"check_same_thread": False},
+    }
+else:
+    engine_options = {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "20")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_pre_ping": True,
+        "pool_recycle": 1800,
+        "pool_timeout": 5,
+    }
+    if DATABASE_URL.startswith("postgresql+asyncpg"):
+        # Avoid JIT compilation stalls on asyncpg's type introspection queries
+        engine_options["connect_args"] = {"server_settings": {"jit": "off"}}
 
 engine = create_async_engine(
     DATABASE_URL,
     echo=False,  # Set to True for SQL debugging
     future=True,
+    **engine_options,
 )
 
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_sqlite_pragma(dbapi_conn, _):
+        """Use WAL so API inserts and batch processor reads/writes don't block each other."""
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL, avoids fsync per commit
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")  # 256MB
+        cursor.execute("PRAGMA cache_size=-16384")  # 16MB per connection
+        cursor.close()
+
+# Postgres channel used to wake the batch processor on new conversations
+NOTIFY_CHANNEL = "conversations_new"
+
 AsyncSessionLocal = async_sessionmaker(
     engine,
     class_=AsyncSession,
@@ -20,10 +68,104 @@ AsyncSessionLocal = async_sessionmaker(
 )
 
 
+# Indexes replaced by newer ones in the models, dropped on existing databases
+SUPERSEDED_INDEXES = [
+    "idx_insight_timestamp",
+    "idx_insight_sentiment",
+    "idx_insight_confidence",
+]
+
+
+# Older databases store insights.clusters as json; convert it to text[]
+# (ALTER ... USING can't take the subquery, so copy through a new column).
+# A no-op once the column is text[]. SQL NULL, JSON null and non-array values
+# become NULL; init_db runs it in the same transaction as the rest of the DDL
+CLUSTERS_TO_ARRAY = """
+DO $$
+BEGIN
+    IF (
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND table_name = 'insights' AND column_name = 'clusters'
+    ) IN ('json', 'jsonb') THEN
+        ALTER TABLE insights ADD COLUMN clusters_array text[];
+        UPDATE insights
+        SET clusters_array = CASE
+            WHEN json_typeof(clusters::json) = 'array'
+            THEN ARRAY(SELECT json_array_elements_text(clusters::json))
+        END;
+        ALTER TABLE insights DROP COLUMN clusters;
+        ALTER TABLE insights RENAME COLUMN clusters_array TO clusters;
+    END IF;
+END $$
+"""
+
+
+def _add_missing_columns(sync_conn):
+    """Add (nullable) columns added to the models after their table was created."""
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=sync_conn.dialect)
+                sync_conn.execute(text(
+                    f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                ))
+
+
+def _create_missing_indexes(sync_conn):
+    """Create indexes added to the models after their table was created."""
+    for name in SUPERSEDED_INDEXES:
+        sync_conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+
+_db_ready = False
+
+
+async def _apply_schema(conn):
+    """Create or migrate tables, indexes and triggers on an open connection."""
+    await conn.run_sync(Base.metadata.create_all, checkfirst=True)
+    if conn.dialect.name == "postgresql":
+        # Must run before the GIN index on insights.clusters is created
+        await conn.execute(text(CLUSTERS_TO_ARRAY))
+    # create_all skips tables that already exist, so add any new columns and indexes
+    await conn.run_sync(_add_missing_columns)
+    await conn.run_sync(_create_missing_indexes)
+    
+    if conn.dialect.name == "postgresql":
+        # Publish every new conversation id so workers wake immediately
+        await conn.execute(text(f"""
+            CREATE OR REPLACE FUNCTION notify_conversations_new() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('{NOTIFY_CHANNEL}', NEW.id::text);
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+        """))
+        await conn.execute(text(
+            "DROP TRIGGER IF EXISTS conversations_notify_insert ON conversations"
+        ))
+        await conn.execute(text("""
+            CREATE TRIGGER conversations_notify_insert
+            AFTER INSERT ON conversations
+            FOR EACH ROW EXECUTE FUNCTION notify_conversations_new()
+        """))
+
+
 async def init_db():
-    """Initialize database tables."""
+    """Initialize database tables (once per process)."""
+    global _db_ready
+    if _db_ready or not RUN_DDL:
+        return
+    
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all, checkfirst=True)
+        await _apply_schema(conn)
+    
+    _db_ready = True
 
 
 async def get_db():
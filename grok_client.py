@@ -1,18 +1,173 @@
 """Grok API client for sentiment analysis and topic clustering."""
 import os
-import json
+import orjson
 import httpx
 from typing import Dict, Optional
 import asyncio
-from datetime import datetime
+import re
+import time
+from contextlib import asynccontextmanager
+from metrics import metrics
 
 GROK_API_URL = "https://api.x.ai/v1/chat/completions"
 GROK_API_KEY = os.getenv("GROK_KEY")
 
 # Rate limiting: 10 calls/second to Grok
-_grok_semaphore = asyncio.Semaphore(10)  # Allow 10 concurrent calls
-_last_call_times = []
-_call_interval = 0.1  # 100ms between calls = 10 calls/second
+GROK_RPS = int(os.getenv("GROK_RPS", "10"))
+GROK_CONCURRENCY = int(os.getenv("GROK_CONCURRENCY", "10"))
+# Concurrency cap: a counter guarded by a condition, so the cap can be resized
+_slots = asyncio.Condition()
+_active = 0
+_max_active = GROK_CONCURRENCY
+_current_rps = GROK_RPS  # Lowered while Grok reports a nearly exhausted quota
+
+# After a 429 the rate stays halved until Retry-After plus this many seconds pass
+RATE_LIMIT_COOLDOWN = 30.0
+_throttled_until: Optional[float] = None
+
+# Token bucket: refills at _current_rps tokens/second, holds at most one second's worth
+_bucket_tokens = float(GROK_RPS)
+_bucket_last: Optional[float] = None
+_bucket_lock = asyncio.Lock()
+
+# Static parts of the analysis prompt; only the conversation text varies
+_PROMPT_HEAD = """Analyze the following Twitter conversation and provide insights in JSON format.
+
+Conversation text: \""""
+
+_PROMPT_TAIL = """"
+
+Please analyze and return a JSON object with the following structure:
+{
+    "sentiment_score": <float between -1.0 (very negative) and 1.0 (very positive)>,
+    "clusters": [<list of topic categories like "product_issues", "delivery_problems", "praise", "complaint", etc.>],
+    "confidence": <float between 0.0 and 1.0 indicating confidence in the analysis>,
+    "reasoning": "<brief explanation of the analysis>"
+}
+
+Focus on:
+1. Sentiment: Determine if the sentiment is positive, negative, or neutral
+2. Topics: Identify main themes (e.g., "product_issues", "delivery_problems", "customer_support", "praise", "complaint")
+3. Confidence: Assess how clear the sentiment and topics are
+
+Return ONLY valid JSON, no additional text."""
+
+# Optional markdown code fence around Grok's JSON; group 1 is the stripped body
+_CODE_FENCE = re.compile(r"^\s*(?:```(?:json)?)?\s*(.*?)\s*(?:```)?\s*$", re.S)
+
+# Shared client so connections (and TLS sessions) are reused across calls;
+# created on first use so it belongs to the running event loop
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    """Return the shared HTTP client, creating it if needed."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(
+                max_connections=GROK_CONCURRENCY,
+                max_keepalive_connections=GROK_CONCURRENCY,
+                keepalive_expiry=60,
+            ),
+        )
+    return _client
+
+
+async def close_client():
+    """Close the shared HTTP client (call on application shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _adjust_rate(headers: httpx.Headers):
+    """Throttle proactively when Grok's rate limit headers show <20% quota left."""
+    global _current_rps
+    remaining = headers.get("x-ratelimit-remaining-requests", headers.get("x-ratelimit-remaining"))
+    limit = headers.get("x-ratelimit-limit-requests", headers.get("x-ratelimit-limit"))
+    if remaining is None or limit is None:
+        return
+    try:
+        remaining, limit = int(remaining), int(limit)
+    except ValueError:
+        return
+    if limit > 0 and remaining < 0.2 * limit:
+        _current_rps = max(1, GROK_RPS // 2)
+    elif _throttled_until is None:
+        # During a post-429 cool-down the full rate is restored by _take_token
+        _current_rps = GROK_RPS
+
+
+@asynccontextmanager
+async def _concurrency_slot():
+    """Hold one of the _max_active concurrent Grok call slots."""
+    global _active
+    async with _slots:
+        await _slots.wait_for(lambda: _active < _max_active)
+        _active += 1
+    try:
+        yield
+    finally:
+        async with _slots:
+            _active -= 1
+            _slots.notify(1)
+
+
+def _throttle(retry_after: float):
+    """Halve the call rate after a 429 until the cool-down has passed."""
+    global _current_rps, _throttled_until
+    _current_rps = max(1, GROK_RPS // 2)
+    _throttled_until = asyncio.get_running_loop().time() + retry_after + RATE_LIMIT_COOLDOWN
+
+
+async def _take_token():
+    """Wait until the token bucket allows another Grok call."""
+    global _bucket_tokens, _bucket_last, _current_rps, _throttled_until
+    while True:
+        async with _bucket_lock:
+            now = asyncio.get_running_loop().time()
+            if _throttled_until is not None and now >= _throttled_until:
+                _current_rps = GROK_RPS
+                _throttled_until = None
+            if _bucket_last is not None:
+                _bucket_tokens = min(
+                    float(_current_rps),
+                    _bucket_tokens + (now - _bucket_last) * _current_rps,
+                )
+            _bucket_last = now
+            
+            if _bucket_tokens >= 1.0:
+                _bucket_tokens -= 1.0
+                return
+            wait_time = (1.0 - _bucket_tokens) / _current_rps
+        
+        await asyncio.sleep(wait_time)
+
+
+def normalize_analysis(analysis: Dict) -> Dict:
+    """
+    Coerce a parsed Grok analysis to the GrokAnalysis schema.
+    
+    Insights are stored and read back without validation, so every field is
+    forced to the schema's type and range here. Raises ValueError if the
+    analysis is not a JSON object or a score is not numeric.
+    """
+    if not isinstance(analysis, dict):
+        raise ValueError(f"Expected a JSON object from Grok, got {type(analysis).__name__}")
+    
+    sentiment_score = analysis.get("sentiment_score")
+    clusters = analysis.get("clusters")
+    confidence = analysis.get("confidence")
+    reasoning = analysis.get("reasoning")
+    return {
+        "sentiment_score": min(1.0, max(-1.0, float(sentiment_score if sentiment_score is not None else 0.0))),
+        "clusters": [str(c) for c in clusters if c is not None] if isinstance(clusters, list) else [],
+        "confidence": min(1.0, max(0.0, float(confidence if confidence is not None else 0.5))),
+        "reasoning": str(reasoning) if reasoning is not None else "Analysis completed",
+    }
 
 
 async def analyze_conversation(text: str) -> Dict:
@@ -30,41 +185,9 @@ async def analyze_conversation(text: str) -> Dict:
     if not GROK_API_KEY:
         raise ValueError("GROK_KEY environment variable not set")
     
-    # Rate limiting: ensure we don't exceed 10 calls/second
-    async with _grok_semaphore:
-        current_time = datetime.now().timestamp()
-        
-        # Remove calls older than 1 second
-        global _last_call_times
-        _last_call_times = [t for t in _last_call_times if current_time - t < 1.0]
-        
-        # If we have 10 calls in the last second, wait
-        if len(_last_call_times) >= 10:
-            wait_time = 1.0 - (current_time - _last_call_times[0])
-            if wait_time > 0:
-                await asyncio.sleep(wait_time)
-        
-        _last_call_times.append(datetime.now().timestamp())
-        
+    async with _concurrency_slot():
         # Prepare prompt for Grok
-        prompt = f"""Analyze the following Twitter conversation and provide insights in JSON format.
-
-Conversation text: "{text}"
-
-Please analyze and return a JSON object with the following structure:
-{{
-    "sentiment_score": <float between -1.0 (very negative) and 1.0 (very positive)>,
-    "clusters": [<list of topic categories like "product_issues", "delivery_problems", "praise", "complaint", etc.>],
-    "confidence": <float between 0.0 and 1.0 indicating confidence in the analysis>,
-    "reasoning": "<brief explanation of the analysis>"
-}}
-
-Focus on:
-1. Sentiment: Determine if the sentiment is positive, negative, or neutral
-2. Topics: Identify main themes (e.g., "product_issues", "delivery_problems", "customer_support", "praise", "complaint")
-3. Confidence: Assess how clear the sentiment and topics are
-
-Return ONLY valid JSON, no additional text."""
+        prompt = _PROMPT_HEAD + text + _PROMPT_TAIL
 
         headers = {
             "Content-Type": "application/json",
@@ -80,59 +203,56 @@ Return ONLY valid JSON, no additional text."""
             "temperature": 0.3,  # Lower temperature for more consistent analysis
         }
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            max_retries = 3
-            for attempt in range(max_retries):
+        max_retries = 3
+        for attempt in range(max_retries):
+            # Every attempt, retries included, goes through the rate limiter
+            await _take_token()
+            try:
+                started = time.monotonic()
                 try:
-                    response = await client.post(GROK_API_URL, json=data, headers=headers)
-                    response.raise_for_status()
-                    
-                    result = response.json()
-                    content = result["choices"][0]["message"]["content"]
-                    
-                    # Parse JSON from Grok response
-                    # Sometimes Grok wraps JSON in markdown code blocks
-                    content = content.strip()
-                    if content.startswith("```json"):
-                        content = content[7:]
-                    if content.startswith("```"):
-                        content = content[3:]
-                    if content.endswith("```"):
-                        content = content[:-3]
-                    content = content.strip()
-                    
-                    analysis = json.loads(content)
-                    
-                    # Validate and normalize response
-                    return {
-                        "sentiment_score": float(analysis.get("sentiment_score", 0.0)),
-                        "clusters": analysis.get("clusters", []),
-                        "confidence": float(analysis.get("confidence", 0.5)),
-                        "reasoning": analysis.get("reasoning", "Analysis completed"),
-                    }
-                    
-                except json.JSONDecodeError as e:
-                    if attempt < max_retries - 1:
-                        await asyncio.sleep(2 ** attempt)  # Exponential backoff
-                        continue
-                    # Fallback response if JSON parsing fails
-                    return {
-                        "sentiment_score": 0.0,
-                        "clusters": ["unknown"],
-                        "confidence": 0.0,
-                        "reasoning": f"Failed to parse Grok response: {str(e)}",
-                    }
-                    
-                except httpx.HTTPStatusError as e:
-                    if e.response.status_code == 429:  # Rate limit
-                        retry_after = int(e.response.headers.get("Retry-After", 5))
-                        await asyncio.sleep(retry_after)
-                        continue
-                    raise
-                    
-                except Exception as e:
-                    if attempt < max_retries - 1:
-                        await asyncio.sleep(2 ** attempt)
-                        continue
+                    response = await _get_client().post(GROK_API_URL, content=orjson.dumps(data), headers=headers)
+                except httpx.HTTPError:
+                    metrics.observe_grok_call(time.monotonic() - started, "error")
                     raise
+                metrics.observe_grok_call(time.monotonic() - started, str(response.status_code))
+                _adjust_rate(response.headers)
+                response.raise_for_status()
+                
+                result = orjson.loads(response.content)
+                content = result["choices"][0]["message"]["content"]
+                
+                # Parse JSON from Grok response
+                # Sometimes Grok wraps JSON in markdown code blocks
+                content = _CODE_FENCE.match(content).group(1)
+                
+                analysis = orjson.loads(content)
+                
+                # Validate and normalize response
+                return normalize_analysis(analysis)
+                
+            except orjson.JSONDecodeError as e:
+                if attempt < max_retries - 1:
+                    await asyncio.sleep(2 ** attempt)  # Exponential backoff
+                    continue
+                # Fallback response if JSON parsing fails
+                return {
+                    "sentiment_score": 0.0,
+                    "clusters": ["unknown"],
+                    "confidence": 0.0,
+                    "reasoning": f"Failed to parse Grok response: {str(e)}",
+                }
+                
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code == 429:  # Rate limit
+                    retry_after = int(e.response.headers.get("Retry-After", 5))
+                    _throttle(retry_after)
+                    await asyncio.sleep(retry_after)
+                    continue
+                raise
+                
+            except Exception as e:
+                if attempt < max_retries - 1:
+                    await asyncio.sleep(2 ** attempt)
+                    continue
+                raise
 
@@ -1,11 +1,14 @@
 """Script to ingest sample data from Kaggle dataset or generate test data."""
 import asyncio
 import csv
-import json
 from datetime import datetime, timedelta
 from pathlib import Path
 import httpx
 import os
+import sys
+
+# Requests in flight at once (httpx's default connection pool size)
+CHUNK_SIZE = 100
 
 # Sample test data if Kaggle dataset is not available
 SAMPLE_CONVERSATIONS = [
@@ -55,22 +58,26 @@ SAMPLE_CONVERSATIONS = [
 async def ingest_from_api(api_url: str, conversations: list):
     """Ingest conversations via API."""
     async with httpx.AsyncClient(timeout=30.0) as client:
-        tasks = []
-        for conv in conversations:
-            payload = {
-                "text": conv["text"],
-                "author": conv.get("author"),
-                "timestamp": (datetime.utcnow() - timedelta(days=1)).isoformat(),
-            }
-            tasks.append(
-                client.post(
-                    f"{api_url}/api/v1/conversations",
-                    json=payload,
-                )
+        results = []
+        # Chunked so in-flight requests stay within the client's connection pool
+        for start in range(0, len(conversations), CHUNK_SIZE):
+            results += await asyncio.gather(
+                *(
+                    asyncio.ensure_future(
+                        client.post(
+                            f"{api_url}/api/v1/conversations",
+                            json={
+                                "text": conv["text"],
+                                "author": conv.get("author"),
+                                "timestamp": (datetime.utcnow() - timedelta(days=1)).isoformat(),
+                            },
+                        )
+                    )
+                    for conv in conversations[start:start + CHUNK_SIZE]
+                ),
+                return_exceptions=True,
             )
         
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
         success_count = sum(1 for r in results if isinstance(r, httpx.Response) and r.status_code == 202)
         print(f"Successfully ingested {success_count}/{len(conversations)} conversations")
         
@@ -103,6 +110,10 @@ async def ingest_from_csv(csv_path: str, api_url: str):
 
 async def main():
     """Main ingestion function."""
+    if sys.version_info >= (3, 12):
+        # Start each request immediately instead of scheduling it a loop tick later
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+    
     api_url = os.getenv("API_URL", "http://localhost:8000")
     
     print(f"Ingesting data to {api_url}")
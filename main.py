@@ -1,14 +1,15 @@
 """FastAPI application for Insights Platform."""
 from fastapi import FastAPI, Depends, HTTPException, status, Query
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select, and_, func
+from sqlalchemy.exc import DataError, IntegrityError
 from datetime import datetime
 from typing import Optional
 import logging
 
-from database import get_db, init_db
-from models import Conversation, Insight
+from database import get_db, init_db, engine, ENV
+from models import Insight
 from schemas import (
     ConversationRequest,
     ConversationResponse,
@@ -17,9 +18,14 @@ from schemas import (
     GrokAnalysis,
     ErrorResponse,
     SentimentFilter,
+    to_naive_utc,
 )
 from rate_limiter import inbound_limiter
-from batch_processor import batch_processor
+from batch_processor import batch_processor, notify_new_conversation
+from batched_inserter import conversation_inserter
+from semantic_cache import semantic_cache
+from grok_client import close_client, normalize_analysis
+from metrics import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -29,6 +35,7 @@ app = FastAPI(
     title="Insights Platform API",
     description="Backend API for analyzing Twitter conversations using Grok",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
 )
 
 
@@ -38,21 +45,47 @@ async def startup_event():
     await init_db()
     logger.info("Database initialized")
     
+    if engine.dialect.name == "sqlite" and ENV != "dev":
+        logger.warning(
+            "Using SQLite outside development: writes are serialized and only "
+            "one batch processor can run. Set DATABASE_URL to a Postgres URL."
+        )
+    
+    semantic_cache.load()
+    
     # Start batch processor in background
     await batch_processor.start()
+    await conversation_inserter.start()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Stop batch processor on shutdown."""
+    await conversation_inserter.stop()
     await batch_processor.stop()
+    await close_client()
+    semantic_cache.save()
     logger.info("Application shutting down")
 
 
 @app.get("/health")
 async def health():
-    """Health check endpoint."""
-    return {"status": "ok"}
+    """Health check endpoint (503 if the batch processor is not running)."""
+    if not batch_processor.alive:
+        return ORJSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "degraded", "batch_processor": "stopped"},
+        )
+    return {"status": "ok", "batch_processor": "running"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus metrics endpoint."""
+    return PlainTextResponse(
+        metrics.render(),
+        media_type="text/plain; version=0.0.4",
+    )
 
 
 @app.post(
@@ -63,23 +96,22 @@ async def health():
         202: {"model": ConversationResponse},
         400: {"model": ErrorResponse},
         429: {"model": ErrorResponse},
+        500: {"model": ErrorResponse},
     },
 )
-async def submit_conversation(
-    request: ConversationRequest,
-    db: AsyncSession = Depends(get_db),
-):
+async def submit_conversation(request: ConversationRequest):
     """
     Submit a new conversation for analysis.
     
     Returns 202 Accepted if queued successfully.
     Returns 429 if rate limit exceeded.
     Returns 400 if request is invalid.
+    Returns 500 if the conversation could not be stored.
     """
     # Rate limiting: 100 requests/second
     if not await inbound_limiter.acquire():
         retry_after = await inbound_limiter.get_retry_after()
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             content={
                 "error": "rate_limit_exceeded",
@@ -88,30 +120,25 @@ async def submit_conversation(
         )
     
     try:
-        # Create conversation record
-        conversation = Conversation(
-            text=request.text,
-            author=request.author,
-            timestamp=request.timestamp or datetime.utcnow(),
-            raw_data=request.raw_data,
-            status="pending",
-        )
-        
-        db.add(conversation)
-        await db.commit()
-        await db.refresh(conversation)
+        # Create conversation record (coalesced with concurrent submissions)
+        conversation_id = await conversation_inserter.submit({
+            "text": request.text,
+            "author": request.author,
+            "timestamp": request.timestamp or datetime.utcnow(),
+            "raw_data": request.raw_data,
+            "status": "pending",
+        })
+        notify_new_conversation()
         
-        logger.info(f"Queued conversation {conversation.id} for analysis")
+        logger.info(f"Queued conversation {conversation_id} for analysis")
         
         return ConversationResponse(
             status="accepted",
-            conversation_id=conversation.id,
+            conversation_id=conversation_id,
             message="Conversation queued for analysis",
         )
         
-    except Exception as e:
-        await db.rollback()
-        logger.error(f"Error submitting conversation: {e}")
+    except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail={
@@ -119,6 +146,55 @@ async def submit_conversation(
                 "details": str(e),
             },
         )
+    
+    # Database errors quote the statement's parameters, which may include rows
+    # submitted by other requests; they are logged, never returned
+    except (DataError, IntegrityError) as e:
+        logger.error(f"Error submitting conversation: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={
+                "error": "invalid_schema",
+                "details": "Conversation was rejected by the database",
+            },
+        )
+    
+    except Exception as e:
+        logger.error(f"Error submitting conversation: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={
+                "error": "internal_error",
+                "details": "Conversation could not be stored",
+            },
+        )
+
+
+def _stored_analysis(sentiment_score, clusters, confidence, reasoning) -> GrokAnalysis:
+    """Build the analysis of a stored insight, normalizing rows that don't fit the schema."""
+    if clusters is None:
+        clusters = []
+    if (
+        isinstance(sentiment_score, float) and -1.0 <= sentiment_score <= 1.0
+        and isinstance(confidence, float) and 0.0 <= confidence <= 1.0
+        and isinstance(clusters, list) and all(isinstance(c, str) for c in clusters)
+        and (reasoning is None or isinstance(reasoning, str))
+    ):
+        return GrokAnalysis.model_construct(
+            sentiment_score=sentiment_score,
+            clusters=clusters,
+            confidence=confidence,
+            reasoning=reasoning,
+        )
+    
+    # Written before analyses were normalized (e.g. out-of-range scores or
+    # non-list clusters): coerce it like a fresh Grok response
+    return GrokAnalysis.model_construct(**normalize_analysis({
+        "sentiment_score": sentiment_score,
+        "clusters": clusters,
+        "confidence": confidence,
+        "reasoning": reasoning,
+    }))
 
 
 @app.get(
@@ -126,7 +202,7 @@ async def submit_conversation(
     response_model=InsightsResponse,
     responses={
         200: {"model": InsightsResponse},
-        400: {"model": ErrorResponse},
+        500: {"model": ErrorResponse},
     },
 )
 async def get_insights(
@@ -147,9 +223,22 @@ async def get_insights(
     - min_confidence: minimum Grok confidence score (optional, 0.0-1.0)
     - sentiment: filter by sentiment (positive/negative/neutral) (optional)
     """
+    # Stored timestamps are naive UTC; an aware bound (e.g. "...Z") must match
+    start_time, end_time = to_naive_utc(start_time), to_naive_utc(end_time)
+    
     try:
-        # Build query
-        query = select(Insight).where(
+        # Build query; the window count gives the total matches before LIMIT,
+        # so metadata doesn't need a second pass over the same filters
+        query = select(
+            Insight.conversation_id,
+            Insight.timestamp,
+            Insight.text,
+            Insight.sentiment_score,
+            Insight.clusters,
+            Insight.confidence,
+            Insight.reasoning,
+            func.count().over().label("total_count"),
+        ).where(
             and_(
                 Insight.timestamp >= start_time,
                 Insight.timestamp <= end_time,
@@ -178,49 +267,25 @@ async def get_insights(
         
         # Execute query
         result = await db.execute(query)
-        insights = result.scalars().all()
+        # Plain column rows: the read path needs no ORM instances
+        rows = result.all()
+        total_count = rows[0].total_count if rows else 0
         
-        # Convert to response format
+        # Convert to response format; model_construct skips validation since
+        # grok_client normalizes analyses to the schema before they are written
         insight_items = [
-            InsightItem(
-                conversation_id=insight.conversation_id,
-                timestamp=insight.timestamp,
-                text=insight.text,
-                grok_analysis=GrokAnalysis(
-                    sentiment_score=insight.sentiment_score,
-                    clusters=insight.clusters or [],
-                    confidence=insight.confidence,
-                    reasoning=insight.reasoning,
-                ),
+            InsightItem.model_construct(
+                conversation_id=conversation_id,
+                timestamp=timestamp,
+                text=text,
+                grok_analysis=_stored_analysis(sentiment_score, clusters, confidence, reasoning),
             )
-            for insight in insights
+            for (
+                conversation_id, timestamp, text, sentiment_score,
+                clusters, confidence, reasoning, _,
+            ) in rows
         ]
         
-        # Get total count (for metadata)
-        count_query = select(Insight).where(
-            and_(
-                Insight.timestamp >= start_time,
-                Insight.timestamp <= end_time,
-            )
-        )
-        if min_confidence is not None:
-            count_query = count_query.where(Insight.confidence >= min_confidence)
-        if sentiment:
-            if sentiment == SentimentFilter.positive:
-                count_query = count_query.where(Insight.sentiment_score > 0.1)
-            elif sentiment == SentimentFilter.negative:
-                count_query = count_query.where(Insight.sentiment_score < -0.1)
-            elif sentiment == SentimentFilter.neutral:
-                count_query = count_query.where(
-                    and_(
-                        Insight.sentiment_score >= -0.1,
-                        Insight.sentiment_score <= 0.1,
-                    )
-                )
-        
-        count_result = await db.execute(count_query)
-        total_count = len(count_result.scalars().all())
-        
         return InsightsResponse(
             insights=insight_items,
             metadata={
@@ -232,12 +297,13 @@ async def get_insights(
         )
         
     except Exception as e:
+        # Logged rather than returned: database errors quote the query
         logger.error(f"Error retrieving insights: {e}")
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail={
-                "error": "invalid_query",
-                "details": str(e),
+                "error": "internal_error",
+                "details": "Insights could not be retrieved",
             },
         )
 
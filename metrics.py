@@ -0,0 +1,69 @@
+"""Lightweight Prometheus-style metrics for the batch processor and Grok client."""
+from collections import defaultdict, deque
+from typing import Deque, Dict
+
+
+class Metrics:
+    """In-process counters, gauges and a recent-window view of Grok calls."""
+
+    def __init__(self, window: int = 50):
+        """
+        Args:
+            window: Number of recent Grok calls used for latency/429 statistics
+        """
+        self.grok_requests: Dict[str, int] = defaultdict(int)
+        self.conversations_processed: Dict[str, int] = defaultdict(int)
+        self.pending_depth = 0
+        self.batch_size = 0
+
+        self._grok_latencies_ms: Deque[float] = deque(maxlen=window)
+        self._grok_rate_limited: Deque[bool] = deque(maxlen=window)
+
+    def observe_grok_call(self, seconds: float, status: str):
+        """Record one Grok HTTP attempt and its outcome (status code or "error")."""
+        self.grok_requests[status] += 1
+        self._grok_latencies_ms.append(seconds * 1000)
+        self._grok_rate_limited.append(status == "429")
+
+    def grok_latency_ms(self, quantile: float) -> float:
+        """Latency quantile over the recent window (0 when no calls yet)."""
+        if not self._grok_latencies_ms:
+            return 0.0
+        ordered = sorted(self._grok_latencies_ms)
+        return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+    def grok_429_rate(self) -> float:
+        """Fraction of recent Grok calls that were rate limited."""
+        if not self._grok_rate_limited:
+            return 0.0
+        return sum(self._grok_rate_limited) / len(self._grok_rate_limited)
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = ["# TYPE grok_requests_total counter"]
+        for status, count in sorted(self.grok_requests.items()):
+            lines.append(f'grok_requests_total{{status="{status}"}} {count}')
+
+        lines.append("# TYPE grok_request_latency_ms summary")
+        for quantile in (0.5, 0.95):
+            lines.append(
+                f'grok_request_latency_ms{{quantile="{quantile}"}} '
+                f"{self.grok_latency_ms(quantile):.1f}"
+            )
+
+        lines.append("# TYPE grok_429_ratio gauge")
+        lines.append(f"grok_429_ratio {self.grok_429_rate():.4f}")
+
+        lines.append("# TYPE conversations_processed_total counter")
+        for status, count in sorted(self.conversations_processed.items()):
+            lines.append(f'conversations_processed_total{{status="{status}"}} {count}')
+
+        lines.append("# TYPE pending_depth gauge")
+        lines.append(f"pending_depth {self.pending_depth}")
+        lines.append("# TYPE batch_size gauge")
+        lines.append(f"batch_size {self.batch_size}")
+        return "\n".join(lines) + "\n"
+
+
+# Global metrics instance
+metrics = Metrics()
@@ -1,27 +1,62 @@
 """Database models for conversations and insights."""
-from sqlalchemy import Column, String, Float, DateTime, JSON, Integer, Index
+from sqlalchemy import Column, String, Float, DateTime, JSON, Integer, Index, LargeBinary
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import deferred
+from sqlalchemy.types import TypeDecorator
 from datetime import datetime
-import uuid
+import json
+import secrets
+import zlib
 
 Base = declarative_base()
 
 
+class CompressedJSON(TypeDecorator):
+    """JSON stored as a zlib-compressed blob (JSONB on Postgres, which compresses via TOAST)."""
+    impl = LargeBinary
+    cache_ok = True
+    
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(JSONB())
+        return dialect.type_descriptor(LargeBinary())
+    
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name == "postgresql":
+            return value
+        return zlib.compress(json.dumps(value, separators=(",", ":")).encode(), 6)
+    
+    def process_result_value(self, value, dialect):
+        if value is None or dialect.name == "postgresql":
+            return value
+        if isinstance(value, str):
+            # Rows written before compression hold plain JSON text
+            return json.loads(value)
+        return json.loads(zlib.decompress(value))
+
+
 class Conversation(Base):
     """Stores raw conversation data from Twitter."""
     __tablename__ = "conversations"
     
-    id = Column(String, primary_key=True, default=lambda: f"conv_{uuid.uuid4().hex[:8]}")
+    id = Column(String, primary_key=True, default=lambda: "conv_" + secrets.token_hex(4))
     text = Column(String, nullable=False)
     author = Column(String)
     timestamp = Column(DateTime, nullable=False, default=datetime.utcnow)
-    raw_data = Column(JSON)  # Store original tweet data
+    raw_data = deferred(Column(JSON))  # Store original tweet data (loaded only on access)
     status = Column(String, default="pending")  # pending, processing, completed, failed
     created_at = Column(DateTime, default=datetime.utcnow)
+    claimed_at = Column(DateTime)  # When a worker set status to processing
     
     __table_args__ = (
         Index('idx_conv_timestamp', 'timestamp'),
         Index('idx_conv_status', 'status'),
+        # FIFO claiming of pending rows: ordered range seek instead of a scan
+        Index(
+            'idx_conv_status_created', 'status', 'created_at', 'id',
+            postgresql_where=(status == "pending"),
+        ),
     )
 
 
@@ -36,19 +71,34 @@ class Insight(Base):
     
     # Grok analysis results
     sentiment_score = Column(Float)  # -1.0 to 1.0
-    clusters = Column(JSON)  # List of topic clusters
+    clusters = Column(JSON().with_variant(ARRAY(String), "postgresql"))  # List of topic clusters (text[] on Postgres)
     confidence = Column(Float)  # 0.0 to 1.0
     reasoning = Column(String)
     
     # Full Grok response for debugging
-    grok_analysis = Column(JSON)
+    grok_analysis = Column(CompressedJSON)
     
     created_at = Column(DateTime, default=datetime.utcnow)
     
     __table_args__ = (
         Index('idx_insight_conversation_id', 'conversation_id'),
-        Index('idx_insight_timestamp', 'timestamp'),
-        Index('idx_insight_sentiment', 'sentiment_score'),
-        Index('idx_insight_confidence', 'confidence'),
+        # Matches get_insights: ordered walk of the time range, stopping at LIMIT,
+        # with the confidence/sentiment filters checked from the index entry
+        Index(
+            'idx_insight_ts_conf_sent',
+            timestamp.desc(), 'confidence', 'sentiment_score',
+        ),
+        # Cluster membership filters (`'x' = ANY(clusters)`); no equivalent on SQLite
+        Index(
+            'idx_insight_clusters', 'clusters', postgresql_using='gin',
+        ).ddl_if(dialect='postgresql'),
     )
 
+
+class AnalysisCache(Base):
+    """Stores Grok analyses keyed by the SHA-256 of the analyzed text."""
+    __tablename__ = "analysis_cache"
+    
+    text_hash = Column(String(64), primary_key=True)
+    analysis = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -1,11 +1,9 @@
 """Rate limiting for API endpoints."""
-from collections import deque
-from datetime import datetime, timedelta
-from typing import Deque
 import asyncio
+import math
 
 class RateLimiter:
-    """Simple token bucket rate limiter."""
+    """Sliding window counter rate limiter."""
     
     def __init__(self, max_requests: int, time_window: float = 1.0):
         """
@@ -15,40 +13,67 @@ class RateLimiter:
         """
         self.max_requests = max_requests
         self.time_window = time_window
-        self.requests: Deque[float] = deque()
-        self.lock = asyncio.Lock()
+        
+        # Request counts for the previous and current fixed windows; the
+        # sliding window estimate weights the previous one by its overlap
+        # No lock needed: acquire/get_retry_after never await, so the event
+        # loop can't interleave another request between read and update
+        # Timestamps come from the event loop's monotonic clock
+        self.prev_count = 0
+        self.cur_count = 0
+        self.window_start = 0.0
+    
+    def _roll(self, now: float):
+        """Advance the fixed windows so that `now` falls in the current one."""
+        elapsed = now - self.window_start
+        if elapsed < self.time_window:
+            return
+        
+        windows_passed = math.floor(elapsed / self.time_window)
+        self.prev_count = self.cur_count if windows_passed == 1 else 0
+        self.cur_count = 0
+        self.window_start += windows_passed * self.time_window
+    
+    def _estimate(self, now: float) -> float:
+        """Estimated requests in the sliding window ending at `now`."""
+        weight = 1.0 - (now - self.window_start) / self.time_window
+        return self.prev_count * weight + self.cur_count
     
     async def acquire(self) -> bool:
         """
         Try to acquire a token. Returns True if allowed, False if rate limited.
         """
-        async with self.lock:
-            now = datetime.now().timestamp()
-            
-            # Remove old requests outside the time window
-            while self.requests and now - self.requests[0] > self.time_window:
-                self.requests.popleft()
-            
-            # Check if we're at the limit
-            if len(self.requests) >= self.max_requests:
-                return False
-            
-            # Add current request
-            self.requests.append(now)
-            return True
+        now = asyncio.get_running_loop().time()
+        self._roll(now)
+        
+        # Check if we're at the limit
+        if self._estimate(now) >= self.max_requests:
+            return False
+        
+        # Count current request
+        self.cur_count += 1
+        return True
     
     async def get_retry_after(self) -> int:
         """Get seconds to wait before retry."""
-        async with self.lock:
-            if not self.requests:
-                return 0
-            
-            oldest_request = self.requests[0]
-            now = datetime.now().timestamp()
-            elapsed = now - oldest_request
-            retry_after = max(0, int(self.time_window - elapsed) + 1)
-            return retry_after
-
+        now = asyncio.get_running_loop().time()
+        self._roll(now)
+        window_end = self.window_start + self.time_window
+        
+        if self.cur_count >= self.max_requests:
+            # The current window alone is full: wait for it to end, then for
+            # its weight (as the previous window) to decay below the limit
+            decay = self.time_window * (1.0 - self.max_requests / self.cur_count)
+            wait = window_end - now + decay
+        elif self.prev_count > 0:
+            # Wait until the previous window's weight leaves room for one more
+            room = self.max_requests - self.cur_count
+            decay = self.time_window * (1.0 - room / self.prev_count)
+            wait = self.window_start + decay - now
+        else:
+            wait = 0.0
+        
+        return max(0, math.ceil(wait))
 
 # Global rate limiters
 # Inbound: 100 requests/second
@@ -1,10 +1,17 @@
 """Pydantic schemas for API requests and responses."""
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional, List
-from datetime import datetime
+from datetime import datetime, timezone
 from enum import Enum
 
 
+def to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Convert an aware datetime to naive UTC, as stored in the DateTime columns."""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
 class SentimentFilter(str, Enum):
     positive = "positive"
     negative = "negative"
@@ -18,11 +25,18 @@ class ConversationRequest(BaseModel):
     timestamp: Optional[datetime] = Field(None, description="Conversation timestamp")
     raw_data: Optional[dict] = Field(None, description="Additional metadata")
     
-    @validator('text')
+    @field_validator('text')
+    @classmethod
     def text_not_empty(cls, v):
-        if not v or not v.strip():
+        v = v.strip()
+        if not v:
             raise ValueError('text cannot be empty')
-        return v.strip()
+        return v
+    
+    @field_validator('timestamp')
+    @classmethod
+    def timestamp_naive_utc(cls, v):
+        return to_naive_utc(v)
 
 
 class ConversationResponse(BaseModel):
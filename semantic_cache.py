@@ -0,0 +1,162 @@
+"""Semantic cache for reusing Grok analyses of near-duplicate conversations."""
+from collections import deque
+from typing import Deque, Dict, FrozenSet, Iterable, List, Optional, Tuple
+import logging
+import math
+import os
+import pickle
+import re
+import zlib
+
+logger = logging.getLogger(__name__)
+
+Vector = Dict[int, float]
+Entry = Tuple[Vector, FrozenSet[str], Dict]
+
+_WORD = re.compile(r"[\w']+")
+
+
+class SemanticCache:
+    """
+    Near-duplicate lookup over previously analyzed texts.
+
+    Texts are embedded as L2-normalized hashed character trigram counts of
+    their lowercased words, which is cheap enough to run in-process (no model
+    download, no numpy). Trigrams measure spelling, not meaning: "great" and
+    "not great" score close together. A hit therefore also requires both texts
+    to use the same set of words, so only case, punctuation, spacing and word
+    order or repetition may differ. The cache is off unless `enabled` is set.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.97,
+        max_entries: int = 2000,
+        dimensions: int = 4096,
+        path: Optional[str] = None,
+        enabled: bool = True,
+    ):
+        """
+        Args:
+            threshold: Minimum cosine similarity for a cache hit
+            max_entries: Maximum cached analyses (oldest are evicted first)
+            dimensions: Number of hash buckets in the embedding
+            path: Pickle file used to persist the cache across restarts
+            enabled: When False, lookups always miss and nothing is cached
+        """
+        self.enabled = enabled
+        self.threshold = threshold
+        self.dimensions = dimensions
+        self.path = path
+        self.entries: Deque[Entry] = deque(maxlen=max_entries)
+
+    @staticmethod
+    def words(text: str) -> List[str]:
+        """Split text into lowercased words, dropping punctuation."""
+        return _WORD.findall(text.lower())
+
+    def embed(self, text: str) -> Vector:
+        """Embed text as a sparse, L2-normalized hashed trigram vector."""
+        normalized = f"  {' '.join(self.words(text))}  "
+        vector: Vector = {}
+        for i in range(len(normalized) - 2):
+            bucket = zlib.crc32(normalized[i:i + 3].encode()) % self.dimensions
+            vector[bucket] = vector.get(bucket, 0.0) + 1.0
+
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        return {k: v / norm for k, v in vector.items()}
+
+    def embed_many(self, texts: Iterable[str]) -> List[Vector]:
+        """Embed a batch of texts up front so each is embedded only once."""
+        return [self.embed(text) for text in texts]
+
+    @staticmethod
+    def _similarity(a: Vector, b: Vector) -> float:
+        """Cosine similarity of two normalized sparse vectors."""
+        if len(a) > len(b):
+            a, b = b, a
+        return sum(w * b.get(k, 0.0) for k, w in a.items())
+
+    def lookup(
+        self,
+        text: str,
+        vector: Optional[Vector] = None,
+        entries: Optional[List[Entry]] = None,
+    ) -> Optional[Dict]:
+        """Return the cached analysis of the most similar text, if close enough."""
+        if vector is None:
+            vector = self.embed(text)
+        if entries is None:
+            entries = self.entries
+        words = frozenset(self.words(text))
+        best_sim, best_analysis = 0.0, None
+        for cached_vector, cached_words, analysis in entries:
+            # A missing or swapped word ("not", "love"/"hate") can flip the meaning
+            if cached_words != words:
+                continue
+            sim = self._similarity(vector, cached_vector)
+            if sim > best_sim:
+                best_sim, best_analysis = sim, analysis
+
+        if best_sim >= self.threshold:
+            return best_analysis
+        return None
+
+    def lookup_many(self, texts: List[str]) -> Tuple[Dict[str, Vector], Dict[str, Dict]]:
+        """
+        Embed and look up a batch of texts.
+
+        Returns the vectors and the cache hits, both keyed by text. The scan is
+        linear in the number of entries, so callers run this off the event
+        loop (asyncio.to_thread); it reads a snapshot in case `add` runs
+        concurrently. Returns nothing when the cache is disabled.
+        """
+        if not self.enabled:
+            return {}, {}
+        entries = list(self.entries)
+        vectors, hits = {}, {}
+        for text, vector in zip(texts, self.embed_many(texts)):
+            vectors[text] = vector
+            analysis = self.lookup(text, vector, entries)
+            if analysis is not None:
+                hits[text] = analysis
+        return vectors, hits
+
+    def add(self, text: str, analysis: Dict, vector: Optional[Vector] = None):
+        """Cache an analysis for future near-duplicate lookups."""
+        if not self.enabled:
+            return
+        if vector is None:
+            vector = self.embed(text)
+        self.entries.append((vector, frozenset(self.words(text)), analysis))
+
+    def load(self):
+        """Load persisted entries from disk, if present."""
+        if not self.enabled or not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as f:
+                # Entries saved without their word sets can't be checked; drop them
+                self.entries.extend(e for e in pickle.load(f) if len(e) == 3)
+            logger.info(f"Loaded {len(self.entries)} semantic cache entries")
+        except Exception as e:
+            logger.error(f"Error loading semantic cache: {e}")
+
+    def save(self):
+        """Persist entries to disk."""
+        if not self.enabled or not self.path:
+            return
+        try:
+            with open(self.path, "wb") as f:
+                pickle.dump(list(self.entries), f)
+        except Exception as e:
+            logger.error(f"Error saving semantic cache: {e}")
+
+
+# Global semantic cache instance
+semantic_cache = SemanticCache(
+    enabled=os.getenv("SEMANTIC_CACHE_ENABLED", "0") == "1",
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.97")),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", "2000")),
+    path=os.getenv("SEMANTIC_CACHE_PATH", "./semantic_cache.pkl"),
+)
@@ -0,0 +1,74 @@
+"""Shared test setup: isolated SQLite database and no persisted caches.
+
+Postgres tests use TEST_POSTGRES_URL (a scratch database; its tables are
+dropped) or, if unset, a throwaway server from the `pgserver` package. They
+are skipped when neither is available.
+"""
+import asyncio
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+# Must be set before the application modules are imported
+_tmpdir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_tmpdir}/test.db"
+os.environ["SEMANTIC_CACHE_PATH"] = ""
+os.environ.setdefault("GROK_KEY", "test-key")
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine on a fresh event loop, releasing pooled DB connections after."""
+    from database import engine
+    
+    async def wrapper(coro):
+        try:
+            return await coro
+        finally:
+            await engine.dispose()
+    
+    return lambda coro: asyncio.run(wrapper(coro))
+
+
+@pytest.fixture(scope="session")
+def postgres_url():
+    url = os.getenv("TEST_POSTGRES_URL")
+    if url:
+        yield url
+        return
+    
+    pgserver = pytest.importorskip("pgserver", reason="needs TEST_POSTGRES_URL or pgserver")
+    datadir = tempfile.mkdtemp()
+    server = pgserver.get_server(datadir, cleanup_mode="stop")
+    yield f"postgresql+asyncpg://postgres@/postgres?host={datadir}"
+    server.cleanup()
+
+
+@pytest.fixture
+def postgres_app(postgres_url, monkeypatch):
+    """Point the application modules at an empty Postgres database."""
+    import analysis_cache
+    import batch_processor
+    import batched_inserter
+    import database
+    import main
+    
+    # No pooling: test clients run their own event loops
+    engine = create_async_engine(postgres_url, poolclass=NullPool)
+    
+    async def drop_tables():
+        async with engine.begin() as conn:
+            await conn.execute(text("DROP TABLE IF EXISTS insights, conversations, analysis_cache CASCADE"))
+    
+    asyncio.run(drop_tables())
+    session_local = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    for module in (database, batch_processor, analysis_cache, main):
+        monkeypatch.setattr(module, "engine", engine)
+    for module in (database, batch_processor, batched_inserter):
+        monkeypatch.setattr(module, "AsyncSessionLocal", session_local)
+    monkeypatch.setattr(database, "_db_ready", False)
+    return engine
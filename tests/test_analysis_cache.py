@@ -0,0 +1,48 @@
+"""Tests for persisting the exact-match analysis cache."""
+from sqlalchemy import delete, select
+
+from analysis_cache import ExactMatchCache
+from database import AsyncSessionLocal, init_db
+from models import AnalysisCache
+
+ANALYSIS = {"sentiment_score": 0.5, "clusters": ["praise"], "confidence": 0.9, "reasoning": "ok"}
+
+
+async def _saved_hashes():
+    async with AsyncSessionLocal() as db:
+        return set((await db.execute(select(AnalysisCache.text_hash))).scalars())
+
+
+def test_rolled_back_flush_is_written_on_next_flush(run):
+    cache = ExactMatchCache()
+    text_hash = cache.key("flush rollback text")
+
+    async def scenario():
+        await init_db()
+        async with AsyncSessionLocal() as db:
+            async with db.begin():
+                await db.execute(delete(AnalysisCache))
+
+        cache.add("flush rollback text", ANALYSIS)
+        async with AsyncSessionLocal() as db:
+            try:
+                async with db.begin():
+                    await cache.flush(db)
+                    raise RuntimeError("commit failed")
+            except RuntimeError:
+                pass
+        after_rollback = await _saved_hashes()
+        unsaved_after_rollback = set(cache._unsaved)
+
+        async with AsyncSessionLocal() as db:
+            async with db.begin():
+                flushed = await cache.flush(db)
+            cache.mark_saved(flushed)
+        return after_rollback, unsaved_after_rollback, await _saved_hashes()
+
+    after_rollback, unsaved_after_rollback, after_commit = run(scenario())
+
+    assert after_rollback == set()
+    assert unsaved_after_rollback == {text_hash}
+    assert after_commit == {text_hash}
+    assert cache._unsaved == {}
@@ -0,0 +1,93 @@
+"""End-to-end API tests."""
+import time
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, insert
+
+import batch_processor
+import main
+from database import AsyncSessionLocal, init_db
+from models import Insight
+from schemas import GrokAnalysis
+
+
+async def _analysis(text):
+    return {"sentiment_score": 0.5, "clusters": ["praise"], "confidence": 0.9, "reasoning": "ok"}
+
+
+def _wait_for_insights(client, params, count, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        response = client.get("/api/v1/insights", params=params)
+        assert response.status_code == 200, response.text
+        insights = response.json()["insights"]
+        if len(insights) >= count or time.monotonic() > deadline:
+            return insights
+        time.sleep(0.1)
+
+
+def test_aware_timestamps_are_stored_and_queried_as_utc(postgres_app, monkeypatch):
+    monkeypatch.setattr(batch_processor, "analyze_conversation", _analysis)
+
+    with TestClient(main.app) as client:
+        for text, timestamp in [
+            ("Great support, thanks", "2025-01-20T10:00:00Z"),
+            ("Package arrived late", "2025-01-20T12:30:00+02:00"),
+        ]:
+            response = client.post(
+                "/api/v1/conversations",
+                json={"text": text, "timestamp": timestamp},
+            )
+            assert response.status_code == 202, response.text
+
+        insights = _wait_for_insights(
+            client,
+            {"start_time": "2025-01-20T00:00:00Z", "end_time": "2025-01-21T00:00:00Z"},
+            count=2,
+        )
+
+    assert [(i["text"], i["timestamp"]) for i in insights] == [
+        ("Package arrived late", "2025-01-20T10:30:00"),
+        ("Great support, thanks", "2025-01-20T10:00:00"),
+    ]
+
+
+def test_legacy_insight_rows_are_returned_normalized(run):
+    legacy = [
+        {"sentiment_score": 0.4, "clusters": None, "confidence": 0.8, "reasoning": "ok"},
+        {"sentiment_score": -3.0, "clusters": {"topic": "billing"}, "confidence": 1.7, "reasoning": None},
+        {"sentiment_score": None, "clusters": ["praise", 7], "confidence": None, "reasoning": "ok"},
+    ]
+
+    async def add_legacy_rows():
+        await init_db()
+        async with AsyncSessionLocal() as db:
+            async with db.begin():
+                await db.execute(delete(Insight))
+                await db.execute(insert(Insight), [
+                    {
+                        "conversation_id": f"conv_legacy{i}",
+                        "timestamp": datetime(2024, 6, 1, 12, i),
+                        "text": "legacy row",
+                        **values,
+                    }
+                    for i, values in enumerate(legacy)
+                ])
+
+    run(add_legacy_rows())
+    with TestClient(main.app) as client:
+        response = client.get(
+            "/api/v1/insights",
+            params={"start_time": "2024-06-01T00:00:00", "end_time": "2024-06-02T00:00:00"},
+        )
+
+    assert response.status_code == 200, response.text
+    analyses = {i["conversation_id"]: i["grok_analysis"] for i in response.json()["insights"]}
+    for analysis in analyses.values():
+        GrokAnalysis(**analysis)
+    assert analyses["conv_legacy0"]["clusters"] == []
+    assert analyses["conv_legacy1"] == {
+        "sentiment_score": -1.0, "clusters": [], "confidence": 1.0, "reasoning": "Analysis completed",
+    }
+    assert analyses["conv_legacy2"]["clusters"] == ["praise", "7"]
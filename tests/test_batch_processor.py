@@ -0,0 +1,214 @@
+"""Tests for claiming and recovering conversations in the batch processor."""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+from sqlalchemy import delete, insert, select, text, update
+
+import batch_processor
+from batch_processor import BatchProcessor
+from database import AsyncSessionLocal, init_db
+from models import Conversation, Insight
+
+
+async def _reset():
+    """Create the schema and empty the tables used by these tests."""
+    await init_db()
+    async with AsyncSessionLocal() as db:
+        async with db.begin():
+            await db.execute(delete(Insight))
+            await db.execute(delete(Conversation))
+
+
+async def _add(texts: List[str], **values) -> List[str]:
+    """Insert conversations and return their ids."""
+    async with AsyncSessionLocal() as db:
+        async with db.begin():
+            result = await db.execute(
+                insert(Conversation).returning(Conversation.id, sort_by_parameter_order=True),
+                [
+                    {"text": text, "timestamp": datetime.utcnow(), "status": "pending", **values}
+                    for text in texts
+                ],
+            )
+            return result.scalars().all()
+
+
+async def _statuses(ids: List[str]) -> Dict[str, str]:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Conversation.id, Conversation.status).where(Conversation.id.in_(ids))
+        )
+        return dict(result.all())
+
+
+async def _wait_for(condition: Callable[[], bool], timeout: float = 5.0):
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.05)
+
+
+async def _analysis(text: str) -> Dict:
+    return {
+        "sentiment_score": 0.5,
+        "clusters": ["praise"],
+        "confidence": 0.9,
+        "reasoning": f"Analyzed {text}",
+    }
+
+
+def test_stop_mid_batch_requeues_claimed_conversations(run, monkeypatch):
+    calls = []
+
+    async def hang(text):
+        calls.append(text)
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(batch_processor, "analyze_conversation", hang)
+
+    async def scenario():
+        await _reset()
+        ids = await _add(["interrupted order question", "interrupted refund request"])
+
+        processor = BatchProcessor(batch_size=10)
+        await processor.start()
+        await _wait_for(lambda: len(calls) == 2)
+        claimed = await _statuses(ids)
+
+        await processor.stop()
+        return claimed, await _statuses(ids)
+
+    claimed, after_stop = run(scenario())
+
+    assert set(claimed.values()) == {"processing"}
+    assert set(after_stop.values()) == {"pending"}
+
+
+def test_expired_claims_are_requeued_and_processed(run, monkeypatch):
+    monkeypatch.setattr(batch_processor, "analyze_conversation", _analysis)
+
+    async def scenario():
+        await _reset()
+        # Claimed by a worker that died ten minutes ago, and one still in progress
+        expired = await _add(
+            ["crashed worker billing issue", "crashed worker login issue"],
+            status="processing",
+            claimed_at=datetime.utcnow() - timedelta(minutes=10),
+        )
+        active = await _add(
+            ["busy worker shipping issue"],
+            status="processing",
+            claimed_at=datetime.utcnow(),
+        )
+
+        processor = BatchProcessor(batch_size=10, claim_timeout=300)
+        await processor.start()
+        try:
+            statuses = {}
+
+            async def poll():
+                statuses.update(await _statuses(expired + active))
+                return all(statuses[i] == "completed" for i in expired)
+
+            async with asyncio.timeout(5):
+                while not await poll():
+                    await asyncio.sleep(0.05)
+        finally:
+            await processor.stop()
+        return expired, active, statuses
+
+    expired, active, statuses = run(scenario())
+
+    assert all(statuses[i] == "completed" for i in expired)
+    assert statuses[active[0]] == "processing"
+
+
+def test_unexpected_error_fails_batch_and_keeps_processing(run, monkeypatch):
+    monkeypatch.setattr(batch_processor, "analyze_conversation", _analysis)
+    original = BatchProcessor._process_batch
+    calls = []
+
+    async def fail_first_batch(self, db, conversations):
+        calls.append(len(conversations))
+        if len(calls) == 1:
+            raise RuntimeError("row rejected by the database")
+        await original(self, db, conversations)
+
+    monkeypatch.setattr(BatchProcessor, "_process_batch", fail_first_batch)
+
+    async def scenario():
+        await _reset()
+        first = await _add(["unexpected error first batch"])
+
+        processor = BatchProcessor(batch_size=10)
+        await processor.start()
+        try:
+            await _wait_for(lambda: len(calls) == 1)
+            second = await _add(["unexpected error second batch"])
+            processor.notify()
+            await _wait_for(lambda: len(calls) == 2, timeout=10)
+            await _wait_for(lambda: processor._claimed_ids == [])
+            return processor.alive, await _statuses(first + second), first, second
+        finally:
+            await processor.stop()
+
+    alive, statuses, first, second = run(scenario())
+
+    assert alive
+    assert statuses[first[0]] == "failed"
+    assert statuses[second[0]] == "completed"
+
+
+def test_notify_counts_each_insert_once_while_listening(monkeypatch):
+    processor = BatchProcessor()
+    monkeypatch.setattr(batch_processor, "batch_processor", processor)
+
+    batch_processor.notify_new_conversation()
+    processor.listening = True
+    # Now the Postgres trigger's NOTIFY is the only signal
+    batch_processor.notify_new_conversation()
+
+    assert processor._pending_hint == 1
+
+
+def test_listener_reconnects_after_its_backend_is_killed(postgres_app, monkeypatch):
+    monkeypatch.setattr(batch_processor, "analyze_conversation", _analysis)
+    listener_pid = text(
+        "SELECT pid FROM pg_stat_activity WHERE query LIKE 'LISTEN%' AND pid <> pg_backend_pid()"
+    )
+
+    async def conversation_status(conn, conv_id):
+        return (await conn.execute(
+            select(Conversation.status).where(Conversation.id == conv_id)
+        )).scalar_one()
+
+    async def scenario():
+        await init_db()
+        processor = BatchProcessor(batch_size=10)
+        await processor.start()
+        try:
+            await _wait_for(lambda: processor.listening)
+            async with postgres_app.connect() as conn:
+                old_pid = (await conn.execute(listener_pid)).scalar_one()
+                await conn.execute(text(f"SELECT pg_terminate_backend({old_pid})"))
+            await _wait_for(lambda: not processor.listening)
+            await _wait_for(lambda: processor.listening)
+
+            async with postgres_app.begin() as conn:
+                new_pid = (await conn.execute(listener_pid)).scalar_one()
+                # Inserted by "another process": only the trigger's NOTIFY signals it
+                conv_id = (await conn.execute(
+                    insert(Conversation).returning(Conversation.id),
+                    [{"text": "after reconnect", "timestamp": datetime.utcnow(), "status": "pending"}],
+                )).scalar_one()
+            async with postgres_app.connect() as conn:
+                async with asyncio.timeout(10):
+                    while await conversation_status(conn, conv_id) != "completed":
+                        await asyncio.sleep(0.05)
+            return old_pid, new_pid
+        finally:
+            await processor.stop()
+
+    old_pid, new_pid = asyncio.run(scenario())
+
+    assert new_pid != old_pid
@@ -0,0 +1,123 @@
+"""Tests for coalescing conversation inserts."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from batched_inserter import BatchedInserter
+from database import AsyncSessionLocal, init_db
+from models import Conversation
+
+
+async def _reset():
+    await init_db()
+    async with AsyncSessionLocal() as db:
+        async with db.begin():
+            await db.execute(delete(Conversation))
+
+
+async def _texts(ids):
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Conversation.id, Conversation.text).where(Conversation.id.in_(ids))
+        )
+        return dict(result.all())
+
+
+def _row(text, **values):
+    return {"text": text, "timestamp": datetime.utcnow(), "status": "pending", **values}
+
+
+def test_concurrent_submits_share_one_insert(run, monkeypatch):
+    inserter = BatchedInserter(max_batch=50, max_wait=0.05)
+    batches = []
+    insert_batch = inserter._insert_batch
+
+    async def counting_insert_batch(batch):
+        batches.append(len(batch))
+        await insert_batch(batch)
+
+    monkeypatch.setattr(inserter, "_insert_batch", counting_insert_batch)
+    texts = [f"coalesced submission {i}" for i in range(5)]
+
+    async def scenario():
+        await _reset()
+        await inserter.start()
+        try:
+            ids = await asyncio.gather(*(inserter.submit(_row(text)) for text in texts))
+        finally:
+            await inserter.stop()
+        return ids, await _texts(ids)
+
+    ids, stored = run(scenario())
+
+    assert batches == [5]
+    assert [stored[i] for i in ids] == texts
+
+
+def test_rejected_row_fails_only_its_own_submit(run):
+    inserter = BatchedInserter(max_batch=50, max_wait=0.05)
+
+    async def scenario():
+        await _reset()
+        async with AsyncSessionLocal() as db:
+            async with db.begin():
+                await db.execute(insert(Conversation), [_row("existing", id="conv_taken")])
+
+        await inserter.start()
+        try:
+            results = await asyncio.gather(
+                *(inserter.submit(_row(f"healthy submission {i}")) for i in range(5)),
+                inserter.submit(_row("duplicate id", id="conv_taken")),
+                return_exceptions=True,
+            )
+        finally:
+            await inserter.stop()
+        healthy = results[:5]
+        return healthy, results[5], await _texts(healthy)
+
+    healthy, rejected, stored = run(scenario())
+
+    assert isinstance(rejected, IntegrityError)
+    assert [stored[i] for i in healthy] == [f"healthy submission {i}" for i in range(5)]
+
+
+@pytest.mark.parametrize("values, message", [
+    ({"text": None}, "Missing required field: text"),
+    ({"text": "hello", "timestamp": None}, "Missing required field: timestamp"),
+    ({"text": "hello", "priority": 1}, "Unknown conversation fields: priority"),
+])
+def test_invalid_rows_are_rejected_before_queueing(values, message):
+    with pytest.raises(ValueError, match=message):
+        BatchedInserter._prepare(values)
+
+
+def test_aware_timestamps_are_stored_as_naive_utc():
+    row = BatchedInserter._prepare({
+        "text": "hello",
+        "timestamp": datetime(2025, 1, 20, 12, 30, tzinfo=timezone(timedelta(hours=2))),
+    })
+
+    assert row["timestamp"] == datetime(2025, 1, 20, 10, 30)
+
+
+def test_stop_writes_rows_already_queued(run):
+    inserter = BatchedInserter(max_batch=2, max_wait=0.05)
+
+    async def scenario():
+        await _reset()
+        await inserter.start()
+        submits = [
+            asyncio.create_task(inserter.submit(_row(f"queued before stop {i}")))
+            for i in range(5)
+        ]
+        await asyncio.sleep(0)
+        await inserter.stop()
+        ids = await asyncio.gather(*submits)
+        return ids, await _texts(ids)
+
+    ids, stored = run(scenario())
+
+    assert [stored[i] for i in ids] == [f"queued before stop {i}" for i in range(5)]
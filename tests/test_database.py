@@ -0,0 +1,114 @@
+"""Tests for schema migrations against a real Postgres server (see conftest)."""
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import insert, select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from database import _apply_schema
+from models import Insight
+
+# Schema as created by earlier versions: JSON clusters, single-column
+# indexes and no conversations.claimed_at
+OLD_SCHEMA = [
+    "DROP TABLE IF EXISTS insights, conversations, analysis_cache CASCADE",
+    """
+    CREATE TABLE conversations (
+        id VARCHAR PRIMARY KEY, text VARCHAR NOT NULL, author VARCHAR,
+        timestamp TIMESTAMP NOT NULL, raw_data JSON, status VARCHAR,
+        created_at TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE insights (
+        id SERIAL PRIMARY KEY, conversation_id VARCHAR NOT NULL,
+        timestamp TIMESTAMP NOT NULL, text VARCHAR NOT NULL,
+        sentiment_score FLOAT, clusters JSON, confidence FLOAT,
+        reasoning VARCHAR, grok_analysis JSON, created_at TIMESTAMP
+    )
+    """,
+    "CREATE INDEX idx_insight_timestamp ON insights (timestamp)",
+    "CREATE INDEX idx_insight_sentiment ON insights (sentiment_score)",
+    "CREATE INDEX idx_insight_confidence ON insights (confidence)",
+]
+
+OLD_CLUSTERS = {
+    "conv_list": "'[\"delivery_problems\", \"complaint\"]'",
+    "conv_empty": "'[]'",
+    "conv_sql_null": "NULL",
+    "conv_json_null": "'null'",
+}
+
+
+async def _clusters(conn):
+    result = await conn.execute(select(Insight.conversation_id, Insight.clusters))
+    return dict(result.all())
+
+
+async def _migrate_old_database(url):
+    engine = create_async_engine(url)
+    try:
+        async with engine.begin() as conn:
+            for statement in OLD_SCHEMA:
+                await conn.execute(text(statement))
+            for conversation_id, clusters in OLD_CLUSTERS.items():
+                await conn.execute(text(
+                    "INSERT INTO insights (conversation_id, timestamp, text, clusters) "
+                    f"VALUES ('{conversation_id}', now(), 'text', {clusters})"
+                ))
+
+        async with engine.begin() as conn:
+            await _apply_schema(conn)
+        async with engine.connect() as conn:
+            migrated = await _clusters(conn)
+            column_type = (await conn.execute(text(
+                "SELECT data_type FROM information_schema.columns "
+                "WHERE table_name = 'insights' AND column_name = 'clusters'"
+            ))).scalar_one()
+            indexes = set((await conn.execute(text(
+                "SELECT indexname FROM pg_indexes WHERE tablename = 'insights'"
+            ))).scalars())
+            claimed_at = (await conn.execute(text(
+                "SELECT count(*) FROM information_schema.columns "
+                "WHERE table_name = 'conversations' AND column_name = 'claimed_at'"
+            ))).scalar_one()
+
+        # Second start: the migration must leave text[] data untouched
+        async with engine.begin() as conn:
+            await _apply_schema(conn)
+            await conn.execute(insert(Insight), [{
+                "conversation_id": "conv_new",
+                "timestamp": datetime.utcnow(),
+                "text": "text",
+                "clusters": ["praise"],
+            }])
+        async with engine.connect() as conn:
+            rerun = await _clusters(conn)
+            praise_rows = (await conn.execute(text(
+                "SELECT conversation_id FROM insights WHERE 'praise' = ANY(clusters)"
+            ))).scalars().all()
+
+        return migrated, column_type, indexes, claimed_at, rerun, praise_rows
+    finally:
+        await engine.dispose()
+
+
+def test_clusters_json_column_migrates_to_text_array(postgres_url):
+    migrated, column_type, indexes, claimed_at, rerun, praise_rows = asyncio.run(
+        _migrate_old_database(postgres_url)
+    )
+
+    assert column_type == "ARRAY"
+    assert migrated == {
+        "conv_list": ["delivery_problems", "complaint"],
+        "conv_empty": [],
+        "conv_sql_null": None,
+        "conv_json_null": None,
+    }
+    assert "idx_insight_clusters" in indexes
+    assert "idx_insight_ts_conf_sent" in indexes
+    assert not indexes & {"idx_insight_timestamp", "idx_insight_sentiment", "idx_insight_confidence"}
+    assert claimed_at == 1
+
+    assert rerun == {**migrated, "conv_new": ["praise"]}
+    assert praise_rows == ["conv_new"]
@@ -0,0 +1,125 @@
+"""Tests for Grok response normalization and rate control."""
+import asyncio
+
+import httpx
+import pytest
+
+import grok_client
+from grok_client import normalize_analysis
+from schemas import GrokAnalysis
+
+
+def test_normalize_clamps_out_of_range_scores():
+    analysis = normalize_analysis({
+        "sentiment_score": 3.5,
+        "clusters": ["praise"],
+        "confidence": -0.2,
+        "reasoning": "Very happy",
+    })
+    
+    assert analysis["sentiment_score"] == 1.0
+    assert analysis["confidence"] == 0.0
+    GrokAnalysis(**analysis)
+
+
+def test_normalize_coerces_non_string_fields():
+    analysis = normalize_analysis({
+        "sentiment_score": "-0.4",
+        "clusters": ["delivery_problems", 7, None],
+        "confidence": 1,
+        "reasoning": {"summary": "late order"},
+    })
+    
+    assert analysis["sentiment_score"] == -0.4
+    assert analysis["clusters"] == ["delivery_problems", "7"]
+    assert isinstance(analysis["reasoning"], str)
+    GrokAnalysis(**analysis)
+
+
+def test_normalize_fills_defaults():
+    analysis = normalize_analysis({"clusters": "not-a-list"})
+    
+    assert analysis == {
+        "sentiment_score": 0.0,
+        "clusters": [],
+        "confidence": 0.5,
+        "reasoning": "Analysis completed",
+    }
+
+
+@pytest.mark.parametrize("payload", [["not", "an", "object"], {"confidence": "high"}])
+def test_normalize_rejects_unusable_payloads(payload):
+    with pytest.raises(ValueError):
+        normalize_analysis(payload)
+
+
+def test_rate_restored_after_429_cooldown(monkeypatch):
+    responses = iter([
+        httpx.Response(429, headers={"Retry-After": "0"}),
+        httpx.Response(200, json={"choices": [{"message": {"content": "{}"}}]}),
+        httpx.Response(200, json={"choices": [{"message": {"content": "{}"}}]}),
+    ])
+    monkeypatch.setattr(grok_client, "GROK_RPS", 10)
+    monkeypatch.setattr(grok_client, "_current_rps", 10)
+    monkeypatch.setattr(grok_client, "RATE_LIMIT_COOLDOWN", 0.2)
+    monkeypatch.setattr(grok_client, "_throttled_until", None)
+    monkeypatch.setattr(grok_client, "_bucket_lock", asyncio.Lock())
+    monkeypatch.setattr(grok_client, "_slots", asyncio.Condition())
+    
+    async def scenario():
+        grok_client._client = httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: next(responses))
+        )
+        try:
+            # 429 (no rate limit headers) then success: still throttled
+            await grok_client.analyze_conversation("first")
+            throttled = grok_client._current_rps
+            
+            await asyncio.sleep(0.3)
+            await grok_client.analyze_conversation("second")
+            return throttled, grok_client._current_rps
+        finally:
+            await grok_client.close_client()
+    
+    throttled, restored = asyncio.run(scenario())
+    
+    assert throttled == 5
+    assert restored == 10
+
+
+def test_retries_take_tokens_and_headers_respect_cooldown(monkeypatch):
+    healthy = {"x-ratelimit-remaining-requests": "900", "x-ratelimit-limit-requests": "1000"}
+    responses = iter([
+        httpx.Response(429, headers={"Retry-After": "0"}),
+        httpx.Response(200, headers=healthy, json={"choices": [{"message": {"content": "{}"}}]}),
+    ])
+    monkeypatch.setattr(grok_client, "GROK_RPS", 10)
+    monkeypatch.setattr(grok_client, "_current_rps", 10)
+    monkeypatch.setattr(grok_client, "_throttled_until", None)
+    monkeypatch.setattr(grok_client, "_bucket_lock", asyncio.Lock())
+    monkeypatch.setattr(grok_client, "_slots", asyncio.Condition())
+    
+    tokens = []
+    take_token = grok_client._take_token
+    
+    async def counting_take_token():
+        tokens.append(1)
+        await take_token()
+    
+    monkeypatch.setattr(grok_client, "_take_token", counting_take_token)
+    
+    async def scenario():
+        grok_client._client = httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: next(responses))
+        )
+        try:
+            await grok_client.analyze_conversation("retried")
+            return grok_client._current_rps
+        finally:
+            await grok_client.close_client()
+    
+    rate = asyncio.run(scenario())
+    
+    assert len(tokens) == 2
+    # Healthy quota headers don't cut the 30s cool-down short
+    assert rate == 5
@@ -0,0 +1,58 @@
+"""Tests for the semantic cache batch lookup."""
+import pytest
+
+from semantic_cache import SemanticCache
+
+
+def test_lookup_many_returns_vectors_and_near_duplicate_hits():
+    cache = SemanticCache()
+    analysis = {"sentiment_score": -0.6, "clusters": ["delivery_problems"]}
+    cache.add("Still waiting on my order, it's been 2 weeks", analysis)
+
+    texts = [
+        "Still waiting on my order... it's been 2 weeks!",
+        "Love the new features, keep up the great work",
+    ]
+    vectors, hits = cache.lookup_many(texts)
+
+    assert set(vectors) == set(texts)
+    assert hits == {texts[0]: analysis}
+
+
+@pytest.mark.parametrize("cached, opposite", [
+    ("The new update is great", "The new update is not great"),
+    ("I love the new features", "I hate the new features"),
+    ("My package arrived on time, very happy", "My package never arrived, not happy"),
+    (
+        "I ordered the blue jacket last week, delivery was fast and the quality is great",
+        "I ordered the blue jacket last week, delivery was fast and the quality is not great",
+    ),
+])
+def test_opposite_meanings_miss_even_at_a_low_threshold(cached, opposite):
+    cache = SemanticCache(threshold=0.5)
+    cache.add(cached, {"sentiment_score": 0.8})
+
+    _, hits = cache.lookup_many([opposite])
+
+    assert hits == {}
+
+
+def test_lookup_many_respects_entry_cap():
+    cache = SemanticCache(max_entries=2)
+    for i in range(5):
+        cache.add(f"templated reply number {i}", {"n": i})
+
+    assert len(cache.entries) == 2
+    _, hits = cache.lookup_many([f"templated reply number {i}" for i in range(5)])
+    assert {text: analysis["n"] for text, analysis in hits.items()} == {
+        "templated reply number 3": 3,
+        "templated reply number 4": 4,
+    }
+
+
+def test_disabled_cache_never_hits():
+    cache = SemanticCache(enabled=False)
+    cache.add("Still waiting on my order", {"sentiment_score": -0.6})
+
+    assert cache.lookup_many(["Still waiting on my order"]) == ({}, {})
+    assert len(cache.entries) == 0